@@ -0,0 +1,25 @@
+import functools
+import importlib.util
+
+import httpx
+from openai import AsyncOpenAI
+
+
+@functools.lru_cache
+def get_http_client() -> httpx.AsyncClient:
+    """
+    One HTTP/2 connection pool shared by every OpenAI client in the process, so
+    concurrent requests are multiplexed instead of each paying for a TLS handshake.
+    HTTP/2 needs the `h2` package (`pip install httpx[http2]`); without it the
+    pool falls back to HTTP/1.1 keep-alive connections.
+    """
+    return httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+
+
+@functools.lru_cache
+def get_async_openai() -> AsyncOpenAI:
+    # Reads the API key from environment variable `OPENAI_API_KEY` by default
+    return AsyncOpenAI(http_client=get_http_client())
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Protocol
+
+
+def key(
+    model: str,
+    temperature: float,
+    messages: Any,
+    schema_json: Any,
+    tool_names: List[str],
+) -> str:
+    """
+    Build a deterministic cache key for an LLM call.
+
+    Args:
+        model: Name of the model being called
+        temperature: Sampling temperature of the call
+        messages: JSON-serializable representation of the prompt messages
+        schema_json: JSON schema of the expected response structure
+        tool_names: Names of the tools bound to the model
+
+    Returns:
+        Hex sha256 digest identifying the request
+    """
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": messages,
+        "schema": schema_json,
+        "tools": sorted(tool_names),
+    }
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class CacheBackend(Protocol):
+    """
+    Storage used to cache LLM responses. Implement this to back the cache with
+    something shared, such as Redis.
+    """
+
+    async def get(self, key: str) -> Optional[str]: ...
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    async def clear(self) -> None: ...
+
+
+class DiskCache:
+    """
+    Cache backend that stores one JSON file per key in `directory`.
+    """
+
+    def __init__(self, directory: str = "~/.cache/llm_cache"):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    async def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+
+        # A corrupt or unreadable entry is treated as a miss
+        try:
+            entry = json.loads(path.read_text())
+            expires_at, value = entry["expires_at"], entry["value"]
+        except (OSError, json.JSONDecodeError, KeyError, TypeError):
+            path.unlink(missing_ok=True)
+            return None
+
+        if expires_at is not None and expires_at < time.time():
+            path.unlink(missing_ok=True)
+            return None
+
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+
+        # Write to a temp file and swap it in, so concurrent readers never see a
+        # half-written entry
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.directory, suffix=".tmp", delete=False
+        ) as f:
+            json.dump({"expires_at": expires_at, "value": value}, f)
+        Path(f.name).replace(self._path(key))
+
+    async def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    async def clear(self) -> None:
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
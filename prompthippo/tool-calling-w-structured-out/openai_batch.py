@@ -0,0 +1,116 @@
+import asyncio
+import json
+from typing import List, Union
+
+import openai
+from pydantic import BaseModel, ValidationError
+from langchain_core.messages import BaseMessage, convert_to_openai_messages
+
+from clients import get_async_openai
+
+
+async def submit_batch(
+    prompts: List[List[BaseMessage]],
+    structure: BaseModel,
+    model_name: str = "gpt-4.1",
+    temperature: float = 0.1,
+    poll_interval: float = 30.0,
+) -> List[Union[BaseModel, Exception]]:
+    """
+    Run structured output over many prompts with OpenAI's Batch API, which is
+    cheaper than individual requests but may take up to 24 hours to complete.
+
+    Args:
+        prompts: List of conversations, each a list of LangChain message objects
+        structure: Pydantic BaseModel class defining the expected response structure
+        model_name: Specific model to use
+        temperature: Model temperature for response generation
+        poll_interval: Seconds to wait between batch status checks
+
+    Returns:
+        Instances of the provided Pydantic model, in the same order as `prompts`.
+        Prompts whose request failed hold an Exception describing the failure
+        instead, so the rest of a (paid, possibly slow) batch is never lost.
+    """
+    client = get_async_openai()
+
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": structure.__name__,
+            # The strict variant of the schema (`additionalProperties: false`,
+            # every field required), so the output is guaranteed to match it
+            "schema": openai.pydantic_function_tool(structure)["function"][
+                "parameters"
+            ],
+            "strict": True,
+        },
+    }
+    lines = [
+        json.dumps(
+            {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model_name,
+                    "temperature": temperature,
+                    "response_format": response_format,
+                    "messages": convert_to_openai_messages(messages),
+                },
+            }
+        )
+        for i, messages in enumerate(prompts)
+    ]
+
+    input_file = await client.files.create(
+        file=("batch.jsonl", "\n".join(lines).encode()), purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed":
+        raise Exception(f"Batch {batch.id} finished with status `{batch.status}`.")
+
+    # Successful rows land in the output file and failed ones in the error file;
+    # either file is missing when it would be empty
+    rows = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id is not None:
+            file = await client.files.content(file_id)
+            rows.extend(json.loads(line) for line in file.text.splitlines())
+
+    results = [None] * len(prompts)
+    errors = {}
+    for row in rows:
+        i = int(row["custom_id"])
+        response = row.get("response")
+
+        if row.get("error"):
+            errors[i] = row["error"].get("message", str(row["error"]))
+        elif response is None:
+            errors[i] = "No response."
+        elif response["status_code"] != 200:
+            errors[i] = f"HTTP {response['status_code']}: {response['body']}"
+        else:
+            content = response["body"]["choices"][0]["message"]["content"]
+            try:
+                results[i] = structure.model_validate_json(content)
+            except ValidationError as e:
+                errors[i] = f"Invalid response: {e}"
+
+    for i, result in enumerate(results):
+        if result is None and i not in errors:
+            errors[i] = "Missing from batch output."
+
+    for i, error in errors.items():
+        results[i] = Exception(f"Batch {batch.id}, prompt {i}: {error}")
+
+    return results
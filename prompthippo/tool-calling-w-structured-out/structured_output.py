@@ -1,11 +1,18 @@
+import asyncio
 import textwrap
-from typing import Literal
+from typing import Callable, Literal, Optional
 
-from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from langchain_core.utils.json import parse_partial_json
+
+from clients import get_async_openai
+from tokens import truncate_to_tokens
 
 
 class BookOutput(BaseModel):
+    # Strict JSON schema mode requires `additionalProperties: false`
+    model_config = ConfigDict(extra="forbid")
+
     target_audience: Literal["kids", "teens", "young adult", "adult", "elderly"] = (
         Field(..., description="The target audience of the book")
     )
@@ -17,30 +24,83 @@ class BookOutput(BaseModel):
     )
 
 
-llm = ChatOpenAI(model="gpt-4.1")
+# The schema never changes, so compile the validator and build the response
+# format once instead of per call
+_BOOK_ADAPTER = TypeAdapter(BookOutput)
+_BOOK_SCHEMA = _BOOK_ADAPTER.json_schema()
+_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "BookOutput", "schema": _BOOK_SCHEMA, "strict": True},
+}
+
+
+async def stream_book_output(
+    messages: list[dict],
+    on_field: Optional[Callable[[str, object], None]] = None,
+) -> BookOutput:
+    """
+    Stream a `BookOutput` from the model, calling `on_field(name, value)` for each
+    field as soon as the model has finished writing it.
+    """
+    stream = await get_async_openai().chat.completions.create(
+        model="gpt-4.1",
+        response_format=_RESPONSE_FORMAT,
+        messages=messages,
+        stream=True,
+    )
+
+    buffer = ""
+    emitted = 0
+
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        buffer += chunk.choices[0].delta.content or ""
 
-llm_with_structure = llm.with_structured_output(BookOutput)
+        # A field is complete once the model starts writing the next one
+        fields = list((parse_partial_json(buffer) or {}).items())
+        if on_field:
+            for name, value in fields[emitted:-1]:
+                on_field(name, value)
+        emitted = max(emitted, len(fields) - 1)
 
-response = llm_with_structure.invoke(
-    [
-        (
-            "system",
-            "You are determining the target audience and reading level of a book based on the first page of the book.",
-        ),
-        (
-            "human",
-            textwrap.dedent("""\
-        Tomorrow, and Tomorrow, and Tomorrow: Chapter 1
+    result = _BOOK_ADAPTER.validate_json(buffer)
+    if on_field:
+        for name, value in list(result.model_dump().items())[emitted:]:
+            on_field(name, value)
 
-        Before Mazer invented himself as Mazer, he was Samson Mazer, and before he was Samson Mazer, he was Samson Masur—a change of two letters that transformed him from a nice, ostensibly Jewish boy to a Professional Builder of Worlds—and for most of his youth, he was Sam, S.A.M. on the hall of fame of his grandfather's Donkey Kong machine, but mainly Sam.
+    return result
 
-        On a late December afternoon, in the waning twentieth century, Sam exited a subway car and found the artery to the escalator clogged by an inert mass of people, who were gaping at a station advertisement. Sam was late. He had a meeting with his academic adviser that he had been postponing for over a month, but that everyone agreed absolutely needed to happen before winter break. Sam didn't care for crowds—being in them, or whatever foolishness they tended to enjoy en masse. But this crowd would not be avoided. He would have to force his way through it if he were to be delivered to the aboveground world.
 
-        Sam wore an elephantine navy wool peacoat that he had inherited from his roommate, Marx, who had bought it freshman year from the Army Navy Surplus Store in town. Marx had left it moldering in its plastic shopping bag just short of an entire semester before Sam asked if he might borrow it. That winter had been unrelenting, and it was an April nor'easter (April! What madness, these Massachusetts winters!) that finally wore Sam's pride down enough to ask Marx for the forgotten coat. Sam pretended that he liked the style of it, and Marx said that Sam might as well take it, which is what Sam knew he would say. Like most things purchased from the Army Navy Surplus Store, the coat emanated mold, dust, and the perspiration of dead boys, and Sam tried not to speculate why the garment had been surplussed. But the coat was far warmer than the windbreaker he had brought from California his freshman year. He also believed that the large coat worked to conceal his size. The coat, its ridiculous scale, only made him look smaller and more childlike.
-        """),
-        ),
-    ]
-)
+# Static instructions go first; the per-request book text goes last
+SYSTEM_PROMPT = "You are determining the target audience and reading level of a book based on the first page of the book."
+
+
+async def main() -> BookOutput:
+    return await stream_book_output(
+        [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {
+                "role": "user",
+                # The first ~512 tokens are plenty to classify the book
+                "content": truncate_to_tokens(
+                    textwrap.dedent("""\
+                Tomorrow, and Tomorrow, and Tomorrow: Chapter 1
+
+                Before Mazer invented himself as Mazer, he was Samson Mazer, and before he was Samson Mazer, he was Samson Masur—a change of two letters that transformed him from a nice, ostensibly Jewish boy to a Professional Builder of Worlds—and for most of his youth, he was Sam, S.A.M. on the hall of fame of his grandfather's Donkey Kong machine, but mainly Sam.
+
+                On a late December afternoon, in the waning twentieth century, Sam exited a subway car and found the artery to the escalator clogged by an inert mass of people, who were gaping at a station advertisement. Sam was late. He had a meeting with his academic adviser that he had been postponing for over a month, but that everyone agreed absolutely needed to happen before winter break. Sam didn't care for crowds—being in them, or whatever foolishness they tended to enjoy en masse. But this crowd would not be avoided. He would have to force his way through it if he were to be delivered to the aboveground world.
+
+                Sam wore an elephantine navy wool peacoat that he had inherited from his roommate, Marx, who had bought it freshman year from the Army Navy Surplus Store in town. Marx had left it moldering in its plastic shopping bag just short of an entire semester before Sam asked if he might borrow it. That winter had been unrelenting, and it was an April nor'easter (April! What madness, these Massachusetts winters!) that finally wore Sam's pride down enough to ask Marx for the forgotten coat. Sam pretended that he liked the style of it, and Marx said that Sam might as well take it, which is what Sam knew he would say. Like most things purchased from the Army Navy Surplus Store, the coat emanated mold, dust, and the perspiration of dead boys, and Sam tried not to speculate why the garment had been surplussed. But the coat was far warmer than the windbreaker he had brought from California his freshman year. He also believed that the large coat worked to conceal his size. The coat, its ridiculous scale, only made him look smaller and more childlike.
+                """)
+                ),
+            },
+        ],
+        on_field=lambda name, value: print(f"{name}: {value}"),
+    )
+
 
-print(type(response))
-print(response)
+if __name__ == "__main__":
+    response = asyncio.run(main())
+    print(type(response))
+    print(response)
@@ -1,12 +1,180 @@
 import textwrap
 import asyncio
-from typing import Literal, List, Optional, Any
-
-from pydantic import BaseModel, Field
+import functools
+import time
+from typing import Literal, List, Optional, Any, Callable, Union
+
+import jsonschema
+import openai
+import orjson
+from pydantic import BaseModel, Field, TypeAdapter
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
+from langchain_core.runnables import Runnable
 from langchain_core.tools import tool
-from langchain_core.messages import BaseMessage, ToolMessage, SystemMessage, HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_core.messages import (
+    AIMessageChunk,
+    BaseMessage,
+    ToolMessage,
+    SystemMessage,
+    HumanMessage,
+    messages_to_dict,
+)
 from langchain_openai import ChatOpenAI
 
+import llm_cache
+from clients import get_http_client
+from llm_cache import CacheBackend
+from openai_batch import submit_batch
+from tokens import truncate_to_tokens
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_structure(structure: BaseModel) -> tuple[TypeAdapter, dict]:
+    """
+    Build the validator and OpenAI tool schema (for `bind_tools`) for `structure`
+    once per class, rather than having LangChain re-introspect the model on every call.
+    """
+    return TypeAdapter(structure), convert_to_openai_tool(structure)
+
+
+# The LLM bindings below are built once per configuration, since binding
+# converts every tool and the structure to an OpenAI function schema.
+@functools.lru_cache(maxsize=4)
+def _get_llm(model_name: str, temperature: float) -> ChatOpenAI:
+    # Retries are handled by `_with_retries`; don't stack the client's own on top
+    return ChatOpenAI(
+        model=model_name,
+        temperature=temperature,
+        max_retries=0,
+        http_async_client=get_http_client(),
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _structured_llm(
+    structure: BaseModel, model_name: str, temperature: float
+) -> Runnable:
+    # `with_structured_output` needs the class (or a titled JSON schema), not the
+    # tool dict from `_compile_structure`. The binding is cached, so the class is
+    # only introspected once.
+    return _get_llm(model_name, temperature).with_structured_output(structure)
+
+
+@functools.lru_cache(maxsize=32)
+def _forced_structure_llm(
+    structure: BaseModel, model_name: str, temperature: float
+) -> Runnable:
+    _, structure_schema = _compile_structure(structure)
+    return _get_llm(model_name, temperature).bind_tools(
+        [structure_schema], tool_choice="any"
+    )
+
+
+# Tools are not hashable, so this cache is keyed on their ids. Each entry keeps
+# its tools alive so the ids cannot be reused by other objects.
+_TOOLS_LLM_CACHE: dict[tuple, tuple[List[Any], Runnable]] = {}
+
+
+def _tools_llm(
+    tools: List[Any], structure: BaseModel, model_name: str, temperature: float
+) -> Runnable:
+    key = (tuple(id(t) for t in tools), structure, model_name, temperature)
+
+    if key not in _TOOLS_LLM_CACHE:
+        if len(_TOOLS_LLM_CACHE) >= 32:
+            del _TOOLS_LLM_CACHE[next(iter(_TOOLS_LLM_CACHE))]
+
+        # Add the structure as a tool alongside other tools
+        # Use tool_choice="any" to force LLM to use any of the tools
+        _, structure_schema = _compile_structure(structure)
+        llm_with_tools = _get_llm(model_name, temperature).bind_tools(
+            tools + [structure_schema], tool_choice="any"
+        )
+        _TOOLS_LLM_CACHE[key] = (list(tools), llm_with_tools)
+
+    return _TOOLS_LLM_CACHE[key][1]
+
+
+def _is_transient(e: BaseException) -> bool:
+    # The same errors the OpenAI client retries by default: connection errors and
+    # timeouts, 408, 409, 429 and 5xx
+    if isinstance(
+        e,
+        (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError),
+    ):
+        return True
+
+    return isinstance(e, openai.APIStatusError) and e.status_code in (408, 409)
+
+
+async def _with_retries(fn: Callable, *args: Any) -> Any:
+    """
+    Await `fn(*args)`, retrying with exponential backoff on transient OpenAI errors.
+    """
+    async for attempt in AsyncRetrying(
+        wait=wait_exponential(multiplier=0.2, max=2),
+        stop=stop_after_attempt(3),
+        retry=retry_if_exception(_is_transient),
+        reraise=True,
+    ):
+        with attempt:
+            return await fn(*args)
+
+
+def _tool_content(tool_result: Any) -> str:
+    """
+    Serialize a tool result for a ToolMessage. Non-string results are sent as JSON
+    rather than Python reprs, which the model reads more reliably in fewer tokens.
+    """
+    if isinstance(tool_result, str):
+        return tool_result
+
+    return orjson.dumps(
+        tool_result, default=str, option=orjson.OPT_SERIALIZE_NUMPY
+    ).decode()
+
+
+async def _astream_with_tool_dispatch(
+    llm: Any,
+    messages: List[BaseMessage],
+    dispatch: Callable[[dict], bool],
+) -> AIMessageChunk:
+    """
+    Stream a response from `llm`, calling `dispatch` on each tool call as soon as
+    the model has finished emitting it. If `dispatch` returns True, streaming stops
+    early and the rest of the response is discarded.
+
+    Returns:
+        The aggregated response message
+    """
+    response = None
+    dispatched = 0
+    stream = llm.astream(messages)
+
+    try:
+        async for chunk in stream:
+            response = chunk if response is None else response + chunk
+
+            # A tool call is complete once the model starts emitting the next one
+            for tool_call in response.tool_calls[dispatched:-1]:
+                dispatched += 1
+                if dispatch(tool_call):
+                    return response
+    finally:
+        await stream.aclose()
+
+    for tool_call in response.tool_calls[dispatched:]:
+        if dispatch(tool_call):
+            break
+
+    return response
+
 
 async def generate_structured_output(
     messages: List[BaseMessage],
@@ -15,13 +183,19 @@ async def generate_structured_output(
     model_name: Optional[str] = "gpt-4.1",
     temperature: float = 0.1,
     max_executions: int = 10,
+    cache: Optional[CacheBackend] = None,
+    cache_ttl: int = 3600,
+    time_budget_s: Optional[float] = None,
 ) -> BaseModel:
     """
     Get a structured response from an LLM using LangChain's with_structured_output method
     with optional tool calling support.
 
     Args:
-        messages: List of LangChain message objects
+        messages:
+            List of LangChain message objects. Put static content (system prompt,
+            examples) first and per-request content last. OpenAI only caches
+            prompt prefixes of 1024+ tokens that are identical across calls.
         structure: Pydantic BaseModel class defining the expected response structure
         tools: Optional list of LangChain tools that the model can use
         model_name: Specific model to use
@@ -29,78 +203,230 @@ async def generate_structured_output(
         max_executions:
             Maximum number of iterations for agent execution (if using tools).
             If `max_executions` = 1, then will simply run structured output.
+        cache:
+            Optional cache backend for responses. Only used for tool-less calls with
+            `temperature` <= 0.1, since tools may have side effects or changing results.
+        cache_ttl: Seconds a cached response stays valid
+        time_budget_s:
+            Optional wall time limit for tool calling. Once exceeded, in-flight tools
+            are cancelled and the structured response is generated immediately.
 
     Returns:
         Instance of the provided Pydantic model with the LLM's response data
     """
     assert max_executions >= 1
 
-    llm = ChatOpenAI(model=model_name, temperature=temperature)
+    start = time.monotonic()
+    structure_adapter, structure_schema = _compile_structure(structure)
 
     # If there are no tools, just simply run a LLM w/ structured output
     if not tools:
-        model_with_structure = llm.with_structured_output(structure)
-        result = await model_with_structure.ainvoke(messages)
+        cache_key = None
+        if cache is not None and temperature <= 0.1:
+            cache_key = llm_cache.key(
+                model_name,
+                temperature,
+                messages_to_dict(messages),
+                structure_schema,
+                [],
+            )
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                return structure_adapter.validate_json(cached)
+
+        model_with_structure = _structured_llm(structure, model_name, temperature)
+        result = await _with_retries(model_with_structure.ainvoke, messages)
+
+        if cache_key is not None:
+            await cache.set(cache_key, result.model_dump_json(), ttl=cache_ttl)
 
         return result
 
-    # Add the structure as a tool alongside other tools
-    all_tools = tools + [structure]
+    # Look tools up by name in O(1) during dispatch
+    tools_by_name = {}
+    for t in tools:
+        if not hasattr(t, "name"):
+            continue
+        if t.name in tools_by_name or t.name == structure.__name__:
+            raise ValueError(f"Duplicate tool name `{t.name}`.")
+        tools_by_name[t.name] = t
 
     # Bind all tools including the structure as a tool
-    # Use tool_choice="any" to force LLM to use any of the tools
-    llm_with_tools = llm.bind_tools(all_tools, tool_choice="any")
-    response = await llm_with_tools.ainvoke(messages)
+    llm_with_tools = _tools_llm(tools, structure, model_name, temperature)
+    llm_forced_structure = _forced_structure_llm(structure, model_name, temperature)
+
+    # Tool calls are started while the model is still decoding the rest of the
+    # response
+    pending: dict[str, asyncio.Task] = {}
+
+    async def _run_one(tool_call: dict) -> Any:
+        tool = tools_by_name.get(tool_call["name"])
+        if tool is None:
+            raise Exception(f"Unknown tool `{tool_call['name']}`.")
+
+        args = tool_call["args"]
+
+        # Remote tools (e.g. MCP) describe their arguments with a JSON schema dict;
+        # catch malformed arguments locally instead of paying for a network round
+        # trip. Pydantic schemas are already checked by `ainvoke` before the tool runs.
+        args_schema = getattr(tool, "args_schema", None)
+        if isinstance(args_schema, dict):
+            try:
+                jsonschema.validate(args, args_schema)
+            except jsonschema.ValidationError as e:
+                path = ".".join(map(str, e.absolute_path)) or "arguments"
+                raise Exception(f"Invalid arguments: {path}: {e.message}")
+
+        return await tool.ainvoke(args)
+
+    def _dispatch(tool_call: dict, run_tools: bool = True) -> bool:
+        # Once the structure is emitted we have our answer; stop decoding
+        if tool_call["name"] == structure.__name__:
+            return True
+
+        if run_tools:
+            pending[tool_call["id"]] = asyncio.create_task(_run_one(tool_call))
+        return False
+
+    async def _stream_turn(dispatch: Callable[[dict], bool]) -> AIMessageChunk:
+        # A retried attempt starts the response over, so drop the tool calls the
+        # failed attempt started; their ids won't appear in the new response
+        for task in pending.values():
+            task.cancel()
+        pending.clear()
+
+        return await _astream_with_tool_dispatch(llm_with_tools, history, dispatch)
+
+    # Copied once and then grown in place, rather than rebuilt every iteration
+    history = list(messages)
+
+    try:
+        # With a single execution there is no turn left to answer tool calls,
+        # so go straight to the forced structure below
+        for turn in range(max_executions if max_executions > 1 else 0):
+            # Tools requested on the last turn would never be answered; don't run them
+            run_tools = turn < max_executions - 1
+
+            response = await _with_retries(
+                _stream_turn, functools.partial(_dispatch, run_tools=run_tools)
+            )
+
+            structure_tool_call = None
 
-    llm_forced_structure = llm.bind_tools([structure], tool_choice="any")
+            for tool_call in response.tool_calls:
+                if tool_call["name"] == structure.__name__:
+                    structure_tool_call = tool_call
+                    break
 
-    for _ in range(max_executions - 1):
-        structure_tool_call = None
+            if structure_tool_call:
+                if not structure_tool_call["args"]:
+                    raise Exception(
+                        "Tool call result empty, likely ran out of tokens. Increase `max_tokens`."
+                    )
 
-        for tool_call in response.tool_calls:
-            if tool_call["name"] == structure.__name__:
-                structure_tool_call = tool_call
+                # Create the structured response from the tool call arguments
+                return structure_adapter.validate_python(structure_tool_call["args"])
+
+            if not run_tools:
                 break
 
-        if structure_tool_call:
-            if not structure_tool_call["args"]:
-                raise Exception(
-                    "Tool call result empty, likely ran out of tokens. Increase `max_tokens`."
+            # Out of time: don't wait on slow tools, answer with what we have
+            if time_budget_s is not None:
+                remaining = time_budget_s - (time.monotonic() - start)
+                if remaining <= 0:
+                    break
+                if pending:
+                    _, not_done = await asyncio.wait(
+                        pending.values(), timeout=remaining
+                    )
+                    if not_done:
+                        break
+
+            # Wait for every dispatched tool call; results keep emission order
+            results = await asyncio.gather(*pending.values(), return_exceptions=True)
+            tool_messages = [
+                ToolMessage(
+                    content=(
+                        f"Error: {str(result)}"
+                        if isinstance(result, Exception)
+                        else _tool_content(result)
+                    ),
+                    tool_call_id=tool_call_id,
                 )
+                for tool_call_id, result in zip(pending, results)
+            ]
+            pending.clear()
 
-            # Create the structured response from the tool call arguments
-            return structure(**structure_tool_call["args"])
-        else:
-            tool_messages = []
+            # Add tool results to conversation and try again
+            history.append(response)
+            history.extend(tool_messages)
+    finally:
+        # Tool calls that are no longer needed, or orphaned by an error
+        for task in pending.values():
+            task.cancel()
 
-            for tool_call in response.tool_calls:
-                # Find and execute the tool
-                for tool in tools:
-                    if hasattr(tool, "name") and tool.name == tool_call["name"]:
-                        try:
-                            tool_result = await tool.ainvoke(tool_call["args"])
-                            tool_messages.append(
-                                ToolMessage(
-                                    content=str(tool_result),
-                                    tool_call_id=tool_call["id"],
-                                )
-                            )
-                            break
-                        except Exception as e:
-                            tool_messages.append(
-                                ToolMessage(
-                                    content=f"Error: {str(e)}",
-                                    tool_call_id=tool_call["id"],
-                                )
-                            )
-                            break
+    # Reached max tool executions or the time budget, generate structured response now.
+    response = await _with_retries(llm_forced_structure.ainvoke, history)
+    return structure_adapter.validate_python(response.tool_calls[0]["args"])
 
-            # Add tool results to conversation and try again
-            messages = messages + [response] + tool_messages
-            response = await llm_with_tools.ainvoke(messages)
 
-    # Reached max tool executions, generate structured response now.
-    return await llm_forced_structure.ainvoke(messages)
+async def generate_structured_output_batch(
+    batch: List[List[BaseMessage]],
+    structure: BaseModel,
+    tools: Optional[List[Any]] = None,
+    model_name: Optional[str] = "gpt-4.1",
+    temperature: float = 0.1,
+    max_executions: int = 10,
+    max_concurrency: int = 10,
+    use_batch_api: bool = False,
+    cache: Optional[CacheBackend] = None,
+    cache_ttl: int = 3600,
+) -> List[Union[BaseModel, Exception]]:
+    """
+    Run `generate_structured_output` over many conversations concurrently.
+
+    Args:
+        batch: List of conversations, each a list of LangChain message objects
+        structure: Pydantic BaseModel class defining the expected response structure
+        tools: Optional list of LangChain tools that the model can use
+        model_name: Specific model to use
+        temperature: Model temperature for response generation
+        max_executions: Maximum number of iterations for each agent execution
+        max_concurrency: Maximum number of conversations in flight at once
+        use_batch_api:
+            Submit the batch through OpenAI's Batch API (cheaper, but can take hours).
+            Only applies when no tool calling is needed, i.e. no `tools` or
+            `max_executions` = 1. Prompts that failed in the batch hold an Exception
+            in the returned list instead of a result.
+        cache: Optional cache backend, see `generate_structured_output`
+        cache_ttl: Seconds a cached response stays valid
+
+    Returns:
+        Instances of the provided Pydantic model, in the same order as `batch`
+    """
+    if use_batch_api and (not tools or max_executions == 1):
+        return await submit_batch(
+            batch, structure, model_name=model_name, temperature=temperature
+        )
+
+    # Each item goes through the single-call path so it gets the same retries
+    # (and, without tools, the same response cache)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _one(messages: List[BaseMessage]) -> BaseModel:
+        async with semaphore:
+            return await generate_structured_output(
+                messages,
+                structure,
+                tools,
+                model_name=model_name,
+                temperature=temperature,
+                max_executions=max_executions,
+                cache=cache,
+                cache_ttl=cache_ttl,
+            )
+
+    return await asyncio.gather(*[_one(messages) for messages in batch])
 
 
 class BookOutput(BaseModel):
@@ -136,26 +462,33 @@ def collect_book_reviews(book_title: str) -> list[str]:
     ]
 
 
+# Static instructions go first; the per-request book text goes last
+SYSTEM_PROMPT = textwrap.dedent("""\
+    When you need multiple independent pieces of information, call all relevant tools in a single response so they can run in parallel. Call tools one at a time only when a later call depends on an earlier result.
+
+    You are classifying books based on their first page of text.
+
+    Use your `collect_book_reviews` tool.
+    """)
+
+
 async def main():
     return await generate_structured_output(
         [
-            SystemMessage(
-                textwrap.dedent("""\
-                You are classifying books based on their first page of text.
-                
-                Use your `collect_book_reviews` tool.
-                """)
-            ),
+            SystemMessage(SYSTEM_PROMPT),
+            # The first ~512 tokens are plenty to classify the book
             HumanMessage(
-                textwrap.dedent("""\
-                Tomorrow, and Tomorrow, and Tomorrow: Chapter 1
+                truncate_to_tokens(
+                    textwrap.dedent("""\
+                    Tomorrow, and Tomorrow, and Tomorrow: Chapter 1
 
-                Before Mazer invented himself as Mazer, he was Samson Mazer, and before he was Samson Mazer, he was Samson Masur—a change of two letters that transformed him from a nice, ostensibly Jewish boy to a Professional Builder of Worlds—and for most of his youth, he was Sam, S.A.M. on the hall of fame of his grandfather's Donkey Kong machine, but mainly Sam.
+                    Before Mazer invented himself as Mazer, he was Samson Mazer, and before he was Samson Mazer, he was Samson Masur—a change of two letters that transformed him from a nice, ostensibly Jewish boy to a Professional Builder of Worlds—and for most of his youth, he was Sam, S.A.M. on the hall of fame of his grandfather's Donkey Kong machine, but mainly Sam.
 
-                On a late December afternoon, in the waning twentieth century, Sam exited a subway car and found the artery to the escalator clogged by an inert mass of people, who were gaping at a station advertisement. Sam was late. He had a meeting with his academic adviser that he had been postponing for over a month, but that everyone agreed absolutely needed to happen before winter break. Sam didn't care for crowds—being in them, or whatever foolishness they tended to enjoy en masse. But this crowd would not be avoided. He would have to force his way through it if he were to be delivered to the aboveground world.
+                    On a late December afternoon, in the waning twentieth century, Sam exited a subway car and found the artery to the escalator clogged by an inert mass of people, who were gaping at a station advertisement. Sam was late. He had a meeting with his academic adviser that he had been postponing for over a month, but that everyone agreed absolutely needed to happen before winter break. Sam didn't care for crowds—being in them, or whatever foolishness they tended to enjoy en masse. But this crowd would not be avoided. He would have to force his way through it if he were to be delivered to the aboveground world.
 
-                Sam wore an elephantine navy wool peacoat that he had inherited from his roommate, Marx, who had bought it freshman year from the Army Navy Surplus Store in town. Marx had left it moldering in its plastic shopping bag just short of an entire semester before Sam asked if he might borrow it. That winter had been unrelenting, and it was an April nor'easter (April! What madness, these Massachusetts winters!) that finally wore Sam's pride down enough to ask Marx for the forgotten coat. Sam pretended that he liked the style of it, and Marx said that Sam might as well take it, which is what Sam knew he would say. Like most things purchased from the Army Navy Surplus Store, the coat emanated mold, dust, and the perspiration of dead boys, and Sam tried not to speculate why the garment had been surplussed. But the coat was far warmer than the windbreaker he had brought from California his freshman year. He also believed that the large coat worked to conceal his size. The coat, its ridiculous scale, only made him look smaller and more childlike.
-                """)
+                    Sam wore an elephantine navy wool peacoat that he had inherited from his roommate, Marx, who had bought it freshman year from the Army Navy Surplus Store in town. Marx had left it moldering in its plastic shopping bag just short of an entire semester before Sam asked if he might borrow it. That winter had been unrelenting, and it was an April nor'easter (April! What madness, these Massachusetts winters!) that finally wore Sam's pride down enough to ask Marx for the forgotten coat. Sam pretended that he liked the style of it, and Marx said that Sam might as well take it, which is what Sam knew he would say. Like most things purchased from the Army Navy Surplus Store, the coat emanated mold, dust, and the perspiration of dead boys, and Sam tried not to speculate why the garment had been surplussed. But the coat was far warmer than the windbreaker he had brought from California his freshman year. He also believed that the large coat worked to conceal his size. The coat, its ridiculous scale, only made him look smaller and more childlike.
+                    """)
+                )
             ),
         ],
         BookOutput,
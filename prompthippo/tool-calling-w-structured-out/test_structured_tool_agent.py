@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import httpx
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import structured_tool_agent
+from structured_tool_agent import BookOutput, generate_structured_output
+
+
+def _fake_openai(request: httpx.Request) -> httpx.Response:
+    # A canned chat completion, so the real ChatOpenAI request/parse path runs offline
+    return httpx.Response(
+        200,
+        json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4.1",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": json.dumps(
+                            {"target_audience": "adult", "reading_level": 3}
+                        ),
+                        "refusal": None,
+                    },
+                }
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        },
+    )
+
+
+def test_structured_output_without_tools(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(
+        structured_tool_agent,
+        "get_http_client",
+        lambda: httpx.AsyncClient(transport=httpx.MockTransport(_fake_openai)),
+    )
+    structured_tool_agent._get_llm.cache_clear()
+    structured_tool_agent._structured_llm.cache_clear()
+
+    try:
+        result = asyncio.run(
+            generate_structured_output(
+                [SystemMessage("Classify the book."), HumanMessage("Chapter 1")],
+                BookOutput,
+            )
+        )
+    finally:
+        structured_tool_agent._get_llm.cache_clear()
+        structured_tool_agent._structured_llm.cache_clear()
+
+    assert result == BookOutput(target_audience="adult", reading_level=3)
@@ -0,0 +1,27 @@
+import functools
+
+import tiktoken
+
+
+@functools.lru_cache
+def _encoding(model_name: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # Older tiktoken releases don't know newer models; they share o200k_base
+        return tiktoken.get_encoding("o200k_base")
+
+
+def truncate_to_tokens(
+    text: str, max_tokens: int = 512, model_name: str = "gpt-4.1"
+) -> str:
+    """
+    Keep only the first `max_tokens` tokens of `text`. Classifying a book only
+    needs a sample of it, and shorter prompts are cheaper and faster.
+    """
+    encoding = _encoding(model_name)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+
+    return encoding.decode(tokens[:max_tokens])
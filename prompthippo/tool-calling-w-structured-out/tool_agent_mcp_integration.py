@@ -1,12 +1,23 @@
 import asyncio
-
+import functools
+import hashlib
+import json
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+
+from mcp.types import Tool
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
 from langchain_core.tools import tool
-from langchain_core.messages import HumanMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents import create_tool_calling_agent
-from langchain.agents import AgentExecutor
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
+from langgraph.graph import StateGraph, MessagesState, START
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.prebuilt import ToolNode, tools_condition
+
+from clients import get_http_client
 
 
 # Create a tool using `@tool` wrapper
@@ -26,47 +37,122 @@ def add(a: float, b: float) -> float:
 
 
 # Get tools off of a remote MCP server
-client = MultiServerMCPClient(
-    {
-        "coingecko": {
-            "url": "https://mcp.api.coingecko.com/sse",
-            "transport": "sse",  # <--- This will change depending on which server you use!
+# Clients are built lazily (not at import) and shared for the whole process
+@functools.lru_cache
+def get_mcp_client() -> MultiServerMCPClient:
+    return MultiServerMCPClient(
+        {
+            "coingecko": {
+                "url": "https://mcp.api.coingecko.com/sse",
+                "transport": "sse",  # <--- This will change depending on which server you use!
+            }
         }
-    }
-)
+    )
+
+
+# Tool schemas rarely change, so keep them on disk instead of doing the SSE
+# handshake to list them on every run. There is one file per server, keyed on
+# its name and connection config, so renamed or reconfigured servers miss.
+MCP_TOOLS_CACHE_DIR = Path("~/.cache/mcp_tools").expanduser()
+
+
+async def _list_server_tools(
+    client: MultiServerMCPClient, server_name: str, ttl: int
+) -> list[dict]:
+    cache_key = hashlib.sha256(
+        json.dumps(
+            [server_name, client.connections[server_name]],
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+    path = MCP_TOOLS_CACHE_DIR / f"{cache_key}.json"
+
+    if path.exists() and time.time() - path.stat().st_mtime < ttl:
+        return json.loads(path.read_text())
+
+    async with client.session(server_name) as session:
+        result = await session.list_tools()
+    schemas = [t.model_dump(mode="json", by_alias=True) for t in result.tools]
+
+    # Write to a temp file and swap it in, so concurrent runs never read a
+    # half-written cache
+    MCP_TOOLS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=MCP_TOOLS_CACHE_DIR, suffix=".tmp", delete=False
+    ) as f:
+        json.dump(schemas, f)
+    Path(f.name).replace(path)
+
+    return schemas
+
+
+async def get_mcp_tools(ttl: int = 3600):
+    client = get_mcp_client()
+
+    # Tools built from a connection (rather than a live session) only connect
+    # to the server when they are actually called
+    return [
+        convert_mcp_tool_to_langchain_tool(
+            None, Tool.model_validate(schema), connection=client.connections[server_name]
+        )
+        for server_name in client.connections
+        for schema in await _list_server_tools(client, server_name, ttl)
+    ]
 
 
-async def get_mcp_tools():
-    tools = await client.get_tools()
-    return tools
+# Reads the API key from environment variable `OPENAI_API_KEY` by default
+# Use `gpt-4.1` since it is trained to do well with tool calls
+@functools.lru_cache(maxsize=4)
+def get_llm(model: str = "gpt-4.1", temperature: float = 0.1) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=model, temperature=temperature, http_async_client=get_http_client()
+    )
 
 
-# Combine the tools into one list
-tools = asyncio.run(get_mcp_tools())
-tools.append(add)
+SYSTEM_PROMPT = textwrap.dedent("""\
+    When you need multiple independent pieces of information, call all relevant tools in a single response so they can run in parallel. Call tools one at a time only when a later call depends on an earlier result.
+
+    You are a helpful assistant. Find the sum of the price of bitcoin and ethereum.
+    """)
+
+
+async def build_agent() -> CompiledStateGraph:
+    # Combine the tools into one list
+    tools = await get_mcp_tools()
+    tools.append(add)
+
+    llm_with_tools = get_llm().bind_tools(tools)
+
+    async def call_llm(state: MessagesState) -> dict:
+        response = await llm_with_tools.ainvoke(
+            [SystemMessage(SYSTEM_PROMPT)] + state["messages"]
+        )
+        return {"messages": [response]}
+
+    # `ToolNode` runs all tool calls from one LLM response concurrently
+    graph = StateGraph(MessagesState)
+    graph.add_node("llm", call_llm)
+    graph.add_node("tools", ToolNode(tools))
+    graph.add_edge(START, "llm")
+    # Go to "tools" if the LLM called any, otherwise finish
+    graph.add_conditional_edges("llm", tools_condition)
+    graph.add_edge("tools", "llm")
+
+    return graph.compile()
 
-# Reads the API key from environment variable `OPENAI_API_KEY` by default
-# Use `gpt-4.1` since it is trained to do well with tool calls
-llm = ChatOpenAI(model="gpt-4.1")
-
-prompt = ChatPromptTemplate(
-    [
-        (
-            "system",
-            "You are a helpful assistant. Find the sum of the price of bitcoin and ethereum.",
-        ),
-        ("placeholder", "{messages}"),
-        ("placeholder", "{agent_scratchpad}"),
-    ]
-)
 
-tool_calling_agent = create_tool_calling_agent(llm, tools, prompt=prompt)
-agent_executor = AgentExecutor(agent=tool_calling_agent, tools=tools, verbose=True)
+async def generate_response(agent: CompiledStateGraph, msg: str) -> str:
+    response = await agent.ainvoke({"messages": [HumanMessage(msg)]})
+    return response["messages"][-1].content
 
 
-async def generate_response(msg: str) -> str:
-    response = await agent_executor.ainvoke({"messages": [HumanMessage(msg)]})
-    return response["output"]
+async def main():
+    agent = await build_agent()
+    return await generate_response(
+        agent, "Can you sum the price of bitcoin and ethereum?"
+    )
 
 
-print(asyncio.run(generate_response("Can you sum the price of bitcoin and ethereum?")))
+if __name__ == "__main__":
+    print(asyncio.run(main()))